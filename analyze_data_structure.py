@@ -5,87 +5,98 @@ Analyzes the data folder structure and PDF content to understand the building da
 """
 
 import os
-import json
 from pathlib import Path
-import PyPDF2
+import fitz  # PyMuPDF
+import orjson
 
 def analyze_folder_structure(data_dir: str = "data"):
     """
     Analyze the folder structure and create a map of all buildings
+    Returns (structure, total number of buildings found)
     """
     print("تحليل هيكل المجلدات...")
     print("=" * 50)
     
     structure = {}
+    total_buildings = 0
     
-    for city_dir in os.listdir(data_dir):
-        city_path = os.path.join(data_dir, city_dir)
-        if not os.path.isdir(city_path):
-            continue
-            
-        print(f"\nالمدينة: {city_dir}")
-        structure[city_dir] = {}
-        
-        for category_dir in os.listdir(city_path):
-            category_path = os.path.join(city_path, category_dir)
-            if not os.path.isdir(category_path):
+    with os.scandir(data_dir) as cities:
+        for city in cities:
+            if not city.is_dir(follow_symlinks=False):
                 continue
-                
-            print(f"  الفئة: {category_dir}")
-            structure[city_dir][category_dir] = {}
             
-            for building_type_dir in os.listdir(category_path):
-                building_type_path = os.path.join(category_path, building_type_dir)
-                if not os.path.isdir(building_type_path):
-                    continue
-                    
-                print(f"    نوع المبنى: {building_type_dir}")
-                structure[city_dir][category_dir][building_type_dir] = []
-                
-                for building_dir in os.listdir(building_type_path):
-                    building_path = os.path.join(building_type_path, building_dir)
-                    if not os.path.isdir(building_path):
+            print(f"\nالمدينة: {city.name}")
+            structure[city.name] = {}
+            
+            with os.scandir(city.path) as categories:
+                for category in categories:
+                    if not category.is_dir(follow_symlinks=False):
                         continue
-                        
-                    print(f"      المبنى: {building_dir}")
                     
-                    # Look for reports directory
-                    reports_path = os.path.join(building_path, "تقارير")
-                    if os.path.exists(reports_path):
-                        for file in os.listdir(reports_path):
-                            if file.lower().endswith('.pdf'):
-                                pdf_path = os.path.join(reports_path, file)
-                                structure[city_dir][category_dir][building_type_dir].append({
-                                    "building_name": building_dir,
-                                    "pdf_file": file,
-                                    "pdf_path": pdf_path
-                                })
-                                print(f"        PDF: {file}")
-    
-    return structure
+                    print(f"  الفئة: {category.name}")
+                    structure[city.name][category.name] = {}
+                    
+                    with os.scandir(category.path) as building_types:
+                        for building_type in building_types:
+                            if not building_type.is_dir(follow_symlinks=False):
+                                continue
+                            
+                            print(f"    نوع المبنى: {building_type.name}")
+                            buildings_list = structure[city.name][category.name][building_type.name] = []
+                            
+                            with os.scandir(building_type.path) as buildings:
+                                for building in buildings:
+                                    if not building.is_dir(follow_symlinks=False):
+                                        continue
+                                    
+                                    print(f"      المبنى: {building.name}")
+                                    
+                                    # Look for reports directory
+                                    try:
+                                        reports = os.scandir(os.path.join(building.path, "تقارير"))
+                                    except FileNotFoundError:
+                                        continue
+                                    
+                                    with reports:
+                                        for report in reports:
+                                            # Most reports use a lowercase extension, so avoid lowering every name
+                                            name = report.name
+                                            is_pdf = name.endswith('.pdf') or name.lower().endswith('.pdf')
+                                            if is_pdf and report.is_file():
+                                                buildings_list.append({
+                                                    "building_name": building.name,
+                                                    "pdf_file": report.name,
+                                                    "pdf_path": report.path
+                                                })
+                                                total_buildings += 1
+                                                print(f"        PDF: {report.name}")
+    
+    return structure, total_buildings
 
 def analyze_pdf_content(pdf_path: str, max_pages: int = 3):
     """
     Analyze PDF content to understand the structure
     """
     try:
-        with open(pdf_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            
-            print(f"\nتحليل PDF: {os.path.basename(pdf_path)}")
-            print(f"عدد الصفحات: {len(reader.pages)}")
-            
-            # Extract text from first few pages
-            text_content = ""
-            for i in range(min(max_pages, len(reader.pages))):
-                page_text = reader.pages[i].extract_text() or ""
-                text_content += f"\n--- الصفحة {i+1} ---\n{page_text}"
-            
-            return {
-                "total_pages": len(reader.pages),
-                "sample_text": text_content[:2000],  # First 2000 characters
-                "file_size_mb": round(os.path.getsize(pdf_path) / (1024 * 1024), 2)
-            }
+        doc = fitz.open(pdf_path)
+        
+        print(f"\nتحليل PDF: {os.path.basename(pdf_path)}")
+        print(f"عدد الصفحات: {doc.page_count}")
+        
+        # Extract text from first few pages
+        text_content = ""
+        for i in range(min(max_pages, doc.page_count)):
+            page_text = doc.load_page(i).get_text()
+            text_content += f"\n--- الصفحة {i+1} ---\n{page_text}"
+        
+        total_pages = doc.page_count
+        doc.close()
+        
+        return {
+            "total_pages": total_pages,
+            "sample_text": text_content[:2000],  # First 2000 characters
+            "file_size_mb": round(os.path.getsize(pdf_path) / (1024 * 1024), 2)
+        }
             
     except Exception as e:
         print(f"خطأ في قراءة PDF {pdf_path}: {e}")
@@ -166,36 +177,29 @@ def main():
     print("=" * 60)
     
     # Analyze folder structure
-    structure = analyze_folder_structure()
+    structure, total_buildings = analyze_folder_structure()
     
     # Save structure to JSON
-    with open("data_structure_analysis.json", "w", encoding="utf-8") as f:
-        json.dump(structure, f, ensure_ascii=False, indent=2)
+    with open("data_structure_analysis.json", "wb") as f:
+        f.write(orjson.dumps(structure, option=orjson.OPT_INDENT_2))
     print(f"\nتم حفظ تحليل الهيكل في: data_structure_analysis.json")
     
-    # Count total buildings
-    total_buildings = 0
-    for city in structure:
-        for category in structure[city]:
-            for building_type in structure[city][category]:
-                total_buildings += len(structure[city][category][building_type])
-    
     print(f"\nإجمالي عدد المباني: {total_buildings}")
     
     # Analyze sample PDFs
     sample_analyses = sample_pdf_analysis(structure, sample_count=2)
     
     # Save sample analyses
-    with open("pdf_content_samples.json", "w", encoding="utf-8") as f:
-        json.dump(sample_analyses, f, ensure_ascii=False, indent=2)
+    with open("pdf_content_samples.json", "wb") as f:
+        f.write(orjson.dumps(sample_analyses, option=orjson.OPT_INDENT_2))
     print(f"تم حفظ عينات المحتوى في: pdf_content_samples.json")
     
     # Generate CSV structure plan
     csv_fields = generate_csv_structure_plan(sample_analyses)
     
     # Save CSV structure plan
-    with open("csv_structure_plan.json", "w", encoding="utf-8") as f:
-        json.dump(csv_fields, f, ensure_ascii=False, indent=2)
+    with open("csv_structure_plan.json", "wb") as f:
+        f.write(orjson.dumps(csv_fields, option=orjson.OPT_INDENT_2))
     print(f"تم حفظ خطة هيكل CSV في: csv_structure_plan.json")
     
     print(f"\nاكتمل التحليل!")
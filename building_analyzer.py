@@ -6,6 +6,7 @@ Extracts building information from PDFs and generates AI-powered suggestions for
 
 import os
 import json
+import hashlib
 import csv
 import uuid
 import random
@@ -14,17 +15,35 @@ from datetime import datetime
 from typing import List, Optional, Dict, Any, Tuple
 from pathlib import Path
 import shutil
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-import PyPDF2
 from google import genai
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from PIL import Image
 import io
-import fitz  # PyMuPDF for image extraction
+import fitz  # PyMuPDF for text and image extraction
+import orjson
 
 load_dotenv()
 
+# Only this much report text is sent to the model
+MAX_PDF_TEXT_CHARS = 8000
+
+# Maximum number of Gemini requests in flight at once
+GEMINI_CONCURRENCY = 16
+
+# Number of worker processes extracting PDFs
+EXTRACTION_WORKERS = os.cpu_count() or 1
+
+# Maximum number of buildings started but not yet written, so extraction cannot run
+# far ahead of Gemini and keep every building's text and images in memory
+MAX_BUILDINGS_IN_FLIGHT = GEMINI_CONCURRENCY + EXTRACTION_WORKERS
+
+# Plain text extraction without ligature or image markup, in content-stream order
+_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES & ~fitz.TEXT_PRESERVE_IMAGES
+
 # Create directories for output
 os.makedirs("building_images", exist_ok=True)
 os.makedirs("building_data", exist_ok=True)
@@ -71,71 +90,22 @@ class BuildingSuggestion(BaseModel):
     ai_confidence: Optional[float] = Field(None, description="AI confidence score (0-1)")
     generated_timestamp: Optional[str] = Field(None, description="When suggestion was generated")
 
-def extract_images_from_pdf(pdf_path: str, building_id: str) -> List[str]:
-    """
-    Extract images from PDF and save them to building-specific directory
-    Returns list of saved image paths
-    """
-    image_paths = []
-    building_image_dir = os.path.join("building_images", building_id)
-    os.makedirs(building_image_dir, exist_ok=True)
-    
-    try:
-        doc = fitz.open(pdf_path)
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            image_list = page.get_images()
-            
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                
-                # Generate random ID for image
-                image_id = str(uuid.uuid4())[:8]
-                image_filename = f"page_{page_num + 1}_img_{img_index + 1}_{image_id}.png"
-                image_path = os.path.join(building_image_dir, image_filename)
-                
-                # Save image
-                with open(image_path, "wb") as image_file:
-                    image_file.write(image_bytes)
-                
-                image_paths.append(image_path)
-        
-        doc.close()
-    except Exception as e:
-        print(f"Error extracting images from {pdf_path}: {e}")
-    
-    return image_paths
+class BuildingReport(BaseModel):
+    """Building information and suggestions returned by a single AI call"""
+    info: BuildingInfo = Field(..., description="Building information extracted from the report")
+    suggestions: List[BuildingSuggestion] = Field(..., description="AI-generated improvement suggestions")
 
-def load_pdf_text(path: str) -> str:
-    """
-    Extract text from PDF file
-    """
-    try:
-        with open(path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            return "".join(page.extract_text() or "" for page in reader.pages)
-    except Exception as e:
-        print(f"Error reading PDF {path}: {e}")
-        return ""
+# Schemas are immutable, so serialize them once instead of per building
+_BUILDING_INFO_SCHEMA = json.dumps(BuildingInfo.model_json_schema(), indent=2, ensure_ascii=False)
+_SUGGESTION_SCHEMA = json.dumps(BuildingSuggestion.model_json_schema(), indent=2, ensure_ascii=False)
 
-def extract_building_info_from_text(pdf_text: str, pdf_path: str, building_id: str, 
-                                  city_name: str, category: str, building_name: str) -> Dict[str, Any]:
-    """
-    Extract building information from PDF text using AI
-    """
-    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-    
-    # Create schema for building information
-    schema_definition = json.dumps(BuildingInfo.model_json_schema(), indent=2, ensure_ascii=False)
-    
-    prompt = f"""تحليل تقرير فني لمبنى واستخراج المعلومات المهمة:
+# Prompt with the schemas filled in once, per-building values are substituted into the placeholders
+_REPORT_PROMPT_TEMPLATE = ("""تحليل تقرير فني لمبنى واستخراج المعلومات المهمة ثم توليد اقتراحات ذكية لتحسين المبنى:
 
 محتوى التقرير:
-{pdf_text[:8000]}...
+{TEXT}...
 
-استخرج المعلومات التالية من التقرير:
+أولاً: استخرج المعلومات التالية من التقرير في الحقل info:
 - سنة البناء
 - عدد الطوابق
 - المساحة الإجمالية
@@ -149,85 +119,18 @@ def extract_building_info_from_text(pdf_text: str, pdf_path: str, building_id: s
 - اسم المفتش
 - تاريخ التقرير
 
-أرجع البيانات في هذا التنسيق:
-{schema_definition}
+أرجع معلومات المبنى في هذا التنسيق:
+{INFO_SCHEMA}
 
 ملاحظات:
-- building_id: {building_id}
-- city_name: {city_name}
-- building_category: {category}
-- building_name: {building_name}
-- pdf_filename: {os.path.basename(pdf_path)}
-- processing_timestamp: {datetime.now().isoformat()}
-
-أرجع فقط JSON صحيح يطابق المخطط."""
-
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt,
-            config={
-                'response_mime_type': 'application/json',
-                'response_schema': BuildingInfo
-            }
-        )
-        
-        # Parse response
-        result = BuildingInfo.model_validate_json(response.text or "{}")
-        return result.model_dump()
-    
-    except Exception as e:
-        print(f"Error analyzing building {building_id}: {e}")
-        # Return basic structure
-        return {
-            "building_id": building_id,
-            "city_name": city_name,
-            "building_category": category,
-            "building_name": building_name,
-            "pdf_filename": os.path.basename(pdf_path),
-            "processing_timestamp": datetime.now().isoformat(),
-            "structural_condition": "غير محدد",
-            "maintenance_status": "غير محدد",
-            "safety_issues": [],
-            "required_repairs": [],
-            "priority_level": "متوسط"
-        }
-
-def generate_building_suggestions(building_info: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """
-    Generate AI-powered suggestions for building improvements
-    """
-    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-    
-    # Create schema for suggestions
-    schema_definition = json.dumps(BuildingSuggestion.model_json_schema(), indent=2, ensure_ascii=False)
-    
-    # Safely handle lists
-    safety_issues = building_info.get('safety_issues', [])
-    if not isinstance(safety_issues, list):
-        safety_issues = []
-    
-    required_repairs = building_info.get('required_repairs', [])
-    if not isinstance(required_repairs, list):
-        required_repairs = []
-    
-    building_summary = f"""
-معلومات المبنى:
-- اسم المبنى: {building_info.get('building_name', 'غير محدد')}
-- المدينة: {building_info.get('city_name', 'غير محدد')}
-- الفئة: {building_info.get('building_category', 'غير محدد')}
-- الحالة الإنشائية: {building_info.get('structural_condition', 'غير محدد')}
-- حالة الصيانة: {building_info.get('maintenance_status', 'غير محدد')}
-- المشاكل الأمنية: {', '.join(safety_issues)}
-- الإصلاحات المطلوبة: {', '.join(required_repairs)}
-- مستوى الأولوية: {building_info.get('priority_level', 'متوسط')}
-"""
-    
-    prompt = f"""بناءً على معلومات المبنى التالية، قم بتوليد اقتراحات ذكية لتحسين المبنى:
-
-{building_summary}
+- building_id: {BID}
+- city_name: {CITY}
+- building_category: {CAT}
+- building_name: {BNAME}
+- pdf_filename: {FNAME}
+- processing_timestamp: {TS}
 
-قم بتوليد 3-5 اقتراحات مختلفة تشمل:
+ثانياً: بناءً على معلومات المبنى المستخرجة، قم بتوليد 3-5 اقتراحات مختلفة في الحقل suggestions تشمل:
 1. اقتراحات إنشائية وأمنية
 2. اقتراحات صيانة وتحسين
 3. اقتراحات تطوير وتحديث
@@ -244,44 +147,194 @@ def generate_building_suggestions(building_info: Dict[str, Any]) -> List[Dict[st
 - المخاطر المحتملة
 - المتطلبات
 
-أرجع الاقتراحات في هذا التنسيق:
-{schema_definition}
+أرجع كل اقتراح في هذا التنسيق:
+{SUGGESTION_SCHEMA}
 
 ملاحظات:
-- building_id: {building_info.get('building_id', 'unknown')}
+- building_id: {BID}
 - suggestion_id: استخدم uuid عشوائي لكل اقتراح
-- generated_timestamp: {datetime.now().isoformat()}
+- generated_timestamp: {TS}
+
+أرجع فقط JSON صحيح يطابق المخطط ويحتوي على الحقلين info و suggestions.""").replace(
+    "{INFO_SCHEMA}", _BUILDING_INFO_SCHEMA
+).replace(
+    "{SUGGESTION_SCHEMA}", _SUGGESTION_SCHEMA
+)
+
+# Gemini already enforces the response schema, so validation is only run on request
+_VALIDATE_AI_RESPONSES = os.getenv('VALIDATE_AI_RESPONSES') == '1'
+
+# Fields that must be present even when validation is skipped, so no incomplete rows are written
+_REQUIRED_FIELDS = {
+    model: tuple(name for name, field in model.model_fields.items() if field.is_required())
+    for model in (BuildingInfo, BuildingSuggestion)
+}
+
+_GEMINI_CLIENT = None
+
+def _get_client() -> genai.Client:
+    """
+    Return the shared Gemini client, creating it on first use
+    """
+    global _GEMINI_CLIENT
+    if _GEMINI_CLIENT is None:
+        _GEMINI_CLIENT = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+    return _GEMINI_CLIENT
+
+def _load_record(model: type, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a schema-constrained AI response object into a record of the given model
+    Skips pydantic validation unless VALIDATE_AI_RESPONSES=1 is set, but still requires an object
+    with every required field
+    """
+    if _VALIDATE_AI_RESPONSES:
+        return model.model_validate(data).model_dump()
+    if not isinstance(data, dict):
+        raise ValueError(f"expected an object, got {type(data).__name__}")
+    missing = [name for name in _REQUIRED_FIELDS[model] if data.get(name) is None]
+    if missing:
+        raise ValueError(f"missing required fields: {', '.join(missing)}")
+    return model.model_construct(**data).model_dump()
+
+def _write_bytes(path: str, data: bytes):
+    """
+    Write raw bytes to a file
+    """
+    with open(path, "wb") as f:
+        f.write(data)
+
+def extract_pdf_content(pdf_path: str, building_id: str,
+                        max_chars: int = MAX_PDF_TEXT_CHARS) -> Tuple[str, List[str]]:
+    """
+    Extract text and images from PDF in a single pass over its pages
+    Text extraction stops once max_chars characters are collected
+    Images are saved once each to building-specific directory
+    Returns (text, list of saved image paths)
+    """
+    text_parts = []
+    text_length = 0
+    image_paths = []
+    seen_xrefs = set()
+    seen_digests = set()
+    building_image_dir = os.path.join("building_images", building_id)
+    os.makedirs(building_image_dir, exist_ok=True)
+    
+    try:
+        # Image files are written in the background while pages are still being parsed
+        with ThreadPoolExecutor(max_workers=4) as io_pool:
+            writes = []
+            doc = fitz.open(pdf_path)
+            for page_num, page in enumerate(doc):
+                if text_length < max_chars:
+                    page_text = page.get_text("text", flags=_TEXT_FLAGS, sort=False)
+                    text_parts.append(page_text)
+                    text_length += len(page_text)
+                
+                for img_index, img in enumerate(page.get_images()):
+                    # Letterheads and logos repeat on every page, save each image once
+                    xref = img[0]
+                    if xref in seen_xrefs:
+                        continue
+                    seen_xrefs.add(xref)
+                    
+                    base_image = doc.extract_image(xref)
+                    image_bytes = base_image["image"]
+                    
+                    digest = hashlib.blake2b(image_bytes, digest_size=16).digest()
+                    if digest in seen_digests:
+                        continue
+                    seen_digests.add(digest)
+                    
+                    # Generate random ID for image
+                    image_id = str(uuid.uuid4())[:8]
+                    image_filename = f"page_{page_num + 1}_img_{img_index + 1}_{image_id}.png"
+                    image_path = os.path.join(building_image_dir, image_filename)
+                    
+                    # Save image
+                    writes.append(io_pool.submit(_write_bytes, image_path, image_bytes))
+                    
+                    image_paths.append(image_path)
+            
+            doc.close()
+            
+            for write in writes:
+                write.result()
+    except Exception as e:
+        print(f"Error extracting content from {pdf_path}: {e}")
+    
+    return "\n".join(text_parts)[:max_chars], image_paths
 
-أرجع قائمة JSON تحتوي على 3-5 اقتراحات."""
+async def analyze_building(pdf_text: str, pdf_path: str, building_id: str, city_name: str,
+                           category: str, building_name: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Extract building information and generate improvement suggestions using a single AI call
+    Returns (building information, list of suggestions)
+    """
+    client = _get_client()
+    timestamp = datetime.now().isoformat()
+    
+    prompt = (_REPORT_PROMPT_TEMPLATE
+              .replace("{BID}", building_id)
+              .replace("{CITY}", city_name)
+              .replace("{CAT}", category)
+              .replace("{BNAME}", building_name)
+              .replace("{FNAME}", os.path.basename(pdf_path))
+              .replace("{TS}", timestamp)
+              # Report text goes last so placeholders inside it are left untouched
+              .replace("{TEXT}", pdf_text[:MAX_PDF_TEXT_CHARS]))
 
     try:
-        response = client.models.generate_content(
+        response = await client.aio.models.generate_content(
             model='gemini-2.0-flash',
             contents=prompt,
             config={
-                'response_mime_type': 'application/json'
+                'response_mime_type': 'application/json',
+                'response_schema': BuildingReport
             }
         )
         
         # Parse response
-        suggestions_data = json.loads(response.text or "[]")
-        if isinstance(suggestions_data, dict):
-            suggestions_data = [suggestions_data]
-        
-        suggestions = []
-        for suggestion_data in suggestions_data:
-            try:
-                suggestion = BuildingSuggestion.model_validate(suggestion_data)
-                suggestions.append(suggestion.model_dump())
-            except Exception as e:
-                print(f"Error validating suggestion: {e}")
-                continue
-        
-        return suggestions
+        report_data = orjson.loads(response.text or "{}")
+        if not isinstance(report_data, dict):
+            raise ValueError(f"expected a JSON object, got {type(report_data).__name__}")
+    except Exception as e:
+        print(f"Error analyzing building {building_id}: {e}")
+        report_data = {}
     
+    try:
+        info_data = report_data.get("info")
+        if not info_data:
+            raise ValueError("response has no building info")
+        building_info = _load_record(BuildingInfo, info_data)
     except Exception as e:
-        print(f"Error generating suggestions for building {building_info.get('building_id', 'unknown')}: {e}")
-        return []
+        print(f"Error validating building info for {building_id}: {e}")
+        # Return basic structure
+        building_info = {
+            "building_id": building_id,
+            "city_name": city_name,
+            "building_category": category,
+            "building_name": building_name,
+            "pdf_filename": os.path.basename(pdf_path),
+            "processing_timestamp": timestamp,
+            "structural_condition": "غير محدد",
+            "maintenance_status": "غير محدد",
+            "safety_issues": [],
+            "required_repairs": [],
+            "priority_level": "متوسط"
+        }
+    
+    suggestions = []
+    suggestions_data = report_data.get("suggestions")
+    if not isinstance(suggestions_data, list):
+        suggestions_data = []
+    for suggestion_data in suggestions_data:
+        try:
+            suggestions.append(_load_record(BuildingSuggestion, suggestion_data))
+        except Exception as e:
+            print(f"Error validating suggestion: {e}")
+            continue
+    
+    return building_info, suggestions
 
 def scan_data_directory(data_dir: str = "data") -> List[Tuple[str, str, str, str, str]]:
     """
@@ -289,177 +342,201 @@ def scan_data_directory(data_dir: str = "data") -> List[Tuple[str, str, str, str
     """
     building_files = []
     
-    for city_dir in os.listdir(data_dir):
-        city_path = os.path.join(data_dir, city_dir)
-        if not os.path.isdir(city_path):
-            continue
-            
-        for category_dir in os.listdir(city_path):
-            category_path = os.path.join(city_path, category_dir)
-            if not os.path.isdir(category_path):
+    with os.scandir(data_dir) as cities:
+        for city in cities:
+            if not city.is_dir(follow_symlinks=False):
                 continue
-                
-            for building_type_dir in os.listdir(category_path):
-                building_type_path = os.path.join(category_path, building_type_dir)
-                if not os.path.isdir(building_type_path):
-                    continue
-                    
-                for building_dir in os.listdir(building_type_path):
-                    building_path = os.path.join(building_type_path, building_dir)
-                    if not os.path.isdir(building_path):
+            
+            with os.scandir(city.path) as categories:
+                for category in categories:
+                    if not category.is_dir(follow_symlinks=False):
                         continue
-                        
-                    # Look for reports directory
-                    reports_path = os.path.join(building_path, "تقارير")
-                    if os.path.exists(reports_path):
-                        for file in os.listdir(reports_path):
-                            if file.lower().endswith('.pdf'):
-                                pdf_path = os.path.join(reports_path, file)
-                                building_files.append((
-                                    city_dir,
-                                    category_dir,
-                                    building_type_dir,
-                                    building_dir,
-                                    pdf_path
-                                ))
+                    
+                    with os.scandir(category.path) as building_types:
+                        for building_type in building_types:
+                            if not building_type.is_dir(follow_symlinks=False):
+                                continue
+                            
+                            with os.scandir(building_type.path) as buildings:
+                                for building in buildings:
+                                    if not building.is_dir(follow_symlinks=False):
+                                        continue
+                                    
+                                    # Look for reports directory
+                                    try:
+                                        reports = os.scandir(os.path.join(building.path, "تقارير"))
+                                    except FileNotFoundError:
+                                        continue
+                                    
+                                    with reports:
+                                        for report in reports:
+                                            # Most reports use a lowercase extension, so avoid lowering every name
+                                            name = report.name
+                                            is_pdf = name.endswith('.pdf') or name.lower().endswith('.pdf')
+                                            if is_pdf and report.is_file():
+                                                building_files.append((
+                                                    city.name,
+                                                    category.name,
+                                                    building_type.name,
+                                                    building.name,
+                                                    report.path
+                                                ))
     
     return building_files
 
-def process_buildings():
+def _stringify(value: Any) -> Any:
     """
-    Main function to process all buildings in data directory
+    Convert lists to strings for CSV output
+    """
+    if isinstance(value, list):
+        return "; ".join(str(v) for v in value)
+    return value
+
+class RecordWriter:
+    """
+    Write records to a CSV file and a detailed JSON file one at a time
+    Files are opened on the first record, so nothing is created for empty results
     """
-    print("بدء تحليل المباني...")
-    
-    # Scan for building files
-    building_files = scan_data_directory()
-    print(f"تم العثور على {len(building_files)} مبنى للتحليل")
-    
-    all_buildings = []
-    all_suggestions = []
     
-    for i, (city, category, building_type, building_name, pdf_path) in enumerate(building_files, 1):
-        print(f"\nمعالجة المبنى {i}/{len(building_files)}: {building_name}")
-        
-        # Generate unique building ID
-        building_id = str(uuid.uuid4())[:12]
+    def __init__(self, csv_file: str, json_file: str, field_names: List[str]):
+        self.csv_file = csv_file
+        self.json_file = json_file
+        self.field_names = field_names
+        self.count = 0
+        self._csv_handle = None
+        self._json_handle = None
+        self._writer = None
+    
+    def _open(self):
+        os.makedirs(os.path.dirname(self.csv_file), exist_ok=True)
+        os.makedirs(os.path.dirname(self.json_file), exist_ok=True)
+        self._csv_handle = open(self.csv_file, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._csv_handle)
+        self._writer.writerow(self.field_names)
+        self._json_handle = open(self.json_file, 'wb')
+        self._json_handle.write(b"[")
+    
+    def write(self, record: Dict[str, Any]):
+        if self._writer is None:
+            self._open()
         
-        # Extract images
-        image_paths = extract_images_from_pdf(pdf_path, building_id)
-        print(f"  تم استخراج {len(image_paths)} صورة")
+        self._writer.writerow(tuple(_stringify(record.get(field, "")) for field in self.field_names))
         
-        # Extract text
-        pdf_text = load_pdf_text(pdf_path)
-        
-        # Extract building information
-        building_info = extract_building_info_from_text(
-            pdf_text, pdf_path, building_id, city, category, building_name
-        )
-        building_info['image_paths'] = image_paths
-        building_info['building_type'] = building_type
-        
-        all_buildings.append(building_info)
-        print(f"  تم استخراج معلومات المبنى")
-        
-        # Generate AI suggestions
-        suggestions = generate_building_suggestions(building_info)
-        all_suggestions.extend(suggestions)
-        print(f"  تم توليد {len(suggestions)} اقتراح")
-    
-    # Save results
-    save_building_data(all_buildings)
-    save_suggestions_data(all_suggestions)
-    
-    print(f"\nاكتمل التحليل!")
-    print(f"تم معالجة {len(all_buildings)} مبنى")
-    print(f"تم توليد {len(all_suggestions)} اقتراح")
-    print(f"الصور محفوظة في: building_images/")
-    print(f"البيانات محفوظة في: building_data/")
-    print(f"الاقتراحات محفوظة في: ai_suggestions/")
+        # Keep the JSON file a single indented array, written element by element
+        item = orjson.dumps(record, option=orjson.OPT_INDENT_2)
+        self._json_handle.write(b",\n" if self.count else b"\n")
+        self._json_handle.write(b"\n".join(b"  " + line for line in item.splitlines()))
+        self.count += 1
+    
+    def close(self):
+        if self._writer is None:
+            return
+        self._json_handle.write(b"\n]")
+        self._json_handle.close()
+        self._csv_handle.close()
+        self._writer = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-def save_building_data(buildings: List[Dict[str, Any]]):
+async def _process_building(pool: ProcessPoolExecutor, in_flight: asyncio.Semaphore, semaphore: asyncio.Semaphore,
+                             building: Tuple[str, str, str, str, str]) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
     """
-    Save building data to CSV files
+    Process a single building (PDF extraction, building information and suggestions)
+    PDF extraction runs in a worker process, so it overlaps with other buildings waiting on Gemini
+    Returns None if the building failed, so the other buildings still finish
     """
-    if not buildings:
-        return
-    
-    # Main building data
-    building_file = "building_data/buildings.csv"
-    os.makedirs(os.path.dirname(building_file), exist_ok=True)
-    
-    # Get all unique field names
-    all_fields = set()
-    for building in buildings:
-        all_fields.update(building.keys())
-    
-    field_names = sorted(list(all_fields))
-    
-    with open(building_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=field_names)
-        writer.writeheader()
-        
-        for building in buildings:
-            # Convert lists to strings
-            row = {}
-            for field in field_names:
-                value = building.get(field, "")
-                if isinstance(value, list):
-                    row[field] = "; ".join(str(v) for v in value)
-                else:
-                    row[field] = value
-            writer.writerow(row)
-    
-    print(f"تم حفظ بيانات المباني في: {building_file}")
+    city, category, building_type, building_name, pdf_path = building
     
-    # Save JSON for detailed analysis
-    json_file = "building_data/buildings_detailed.json"
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(buildings, f, ensure_ascii=False, indent=2)
-    
-    print(f"تم حفظ البيانات التفصيلية في: {json_file}")
+    async with in_flight:
+        try:
+            # Generate unique building ID
+            building_id = str(uuid.uuid4())[:12]
+            
+            # Extract text and images
+            loop = asyncio.get_running_loop()
+            pdf_text, image_paths = await loop.run_in_executor(pool, extract_pdf_content, pdf_path, building_id)
+            
+            # Extract building information and AI suggestions
+            async with semaphore:
+                building_info, suggestions = await analyze_building(
+                    pdf_text, pdf_path, building_id, city, category, building_name
+                )
+            building_info['image_paths'] = image_paths
+            building_info['building_type'] = building_type
+            
+            return building_info, suggestions
+        except Exception as e:
+            print(f"Error processing building {building_name} ({pdf_path}): {e}")
+            return None
 
-def save_suggestions_data(suggestions: List[Dict[str, Any]]):
+async def _process_all(building_files: List[Tuple[str, str, str, str, str]],
+                       buildings_writer: RecordWriter, suggestions_writer: RecordWriter):
     """
-    Save AI suggestions to CSV files
+    Run all buildings through the extraction and analysis pipeline
+    Results are written as soon as each building is done instead of being kept in memory
     """
-    if not suggestions:
-        return
-    
-    # Main suggestions data
-    suggestions_file = "ai_suggestions/suggestions.csv"
-    os.makedirs(os.path.dirname(suggestions_file), exist_ok=True)
-    
-    # Get all unique field names
-    all_fields = set()
-    for suggestion in suggestions:
-        all_fields.update(suggestion.keys())
-    
-    field_names = sorted(list(all_fields))
-    
-    with open(suggestions_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=field_names)
-        writer.writeheader()
+    in_flight = asyncio.Semaphore(MAX_BUILDINGS_IN_FLIGHT)
+    semaphore = asyncio.Semaphore(GEMINI_CONCURRENCY)
+    
+    with ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS) as pool:
+        # Finished tasks are not referenced anywhere else, so each result is freed once it is written
+        tasks = asyncio.as_completed([
+            asyncio.ensure_future(_process_building(pool, in_flight, semaphore, building))
+            for building in building_files
+        ])
         
-        for suggestion in suggestions:
-            # Convert lists to strings
-            row = {}
-            for field in field_names:
-                value = suggestion.get(field, "")
-                if isinstance(value, list):
-                    row[field] = "; ".join(str(v) for v in value)
-                else:
-                    row[field] = value
-            writer.writerow(row)
+        for i, task in enumerate(tasks, 1):
+            result = await task
+            if result is None:
+                continue
+            building_info, suggestions = result
+            buildings_writer.write(building_info)
+            for suggestion in suggestions:
+                suggestions_writer.write(suggestion)
+            print(f"\nاكتمل المبنى {i}/{len(building_files)}: {building_info.get('building_name', 'غير محدد')}")
+            print(f"  تم استخراج {len(building_info.get('image_paths') or [])} صورة")
+            print(f"  تم توليد {len(suggestions)} اقتراح")
+
+def process_buildings():
+    """
+    Main function to process all buildings in data directory
+    Buildings are independent, so PDF parsing and Gemini requests of different buildings overlap
+    """
+    print("بدء تحليل المباني...")
     
-    print(f"تم حفظ الاقتراحات في: {suggestions_file}")
+    # Scan for building files
+    building_files = scan_data_directory()
+    print(f"تم العثور على {len(building_files)} مبنى للتحليل")
     
-    # Save JSON for detailed analysis
-    json_file = "ai_suggestions/suggestions_detailed.json"
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(suggestions, f, ensure_ascii=False, indent=2)
+    buildings_writer = RecordWriter(
+        "building_data/buildings.csv", "building_data/buildings_detailed.json",
+        list(BuildingInfo.model_fields)
+    )
+    suggestions_writer = RecordWriter(
+        "ai_suggestions/suggestions.csv", "ai_suggestions/suggestions_detailed.json",
+        list(BuildingSuggestion.model_fields)
+    )
+    
+    with buildings_writer, suggestions_writer:
+        asyncio.run(_process_all(building_files, buildings_writer, suggestions_writer))
+    
+    if buildings_writer.count:
+        print(f"تم حفظ بيانات المباني في: {buildings_writer.csv_file}")
+        print(f"تم حفظ البيانات التفصيلية في: {buildings_writer.json_file}")
+    if suggestions_writer.count:
+        print(f"تم حفظ الاقتراحات في: {suggestions_writer.csv_file}")
+        print(f"تم حفظ الاقتراحات التفصيلية في: {suggestions_writer.json_file}")
     
-    print(f"تم حفظ الاقتراحات التفصيلية في: {json_file}")
+    print(f"\nاكتمل التحليل!")
+    print(f"تم معالجة {buildings_writer.count} مبنى")
+    print(f"تم توليد {suggestions_writer.count} اقتراح")
+    print(f"الصور محفوظة في: building_images/")
+    print(f"البيانات محفوظة في: building_data/")
+    print(f"الاقتراحات محفوظة في: ai_suggestions/")
 
 if __name__ == "__main__":
     process_buildings() 
\ No newline at end of file
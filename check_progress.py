@@ -6,8 +6,33 @@ Check the progress of building analysis
 
 import os
 import json
+import subprocess
 from datetime import datetime
 
+def is_process_running(pattern: str) -> bool:
+    """
+    Check if any other process has pattern in its command line
+    Reads /proc directly instead of starting pgrep, falling back to pgrep where /proc is missing
+    """
+    if not os.path.isdir("/proc"):
+        result = subprocess.run(['pgrep', '-f', pattern], capture_output=True, text=True)
+        return result.returncode == 0
+    
+    needle = pattern.encode()
+    own_pid = str(os.getpid())
+    with os.scandir("/proc") as entries:
+        for entry in entries:
+            if not entry.name.isdigit() or entry.name == own_pid:
+                continue
+            try:
+                with open(os.path.join(entry.path, "cmdline"), "rb") as f:
+                    if needle in f.read():
+                        return True
+            except OSError:
+                # Process exited or is not readable
+                continue
+    return False
+
 def check_progress():
     """
     Check the current progress of building analysis
@@ -17,12 +42,14 @@ def check_progress():
     
     # Check building images
     if os.path.exists("building_images"):
-        building_dirs = [d for d in os.listdir("building_images") if os.path.isdir(os.path.join("building_images", d))]
+        building_dirs = []
         total_images = 0
-        for building_dir in building_dirs:
-            building_path = os.path.join("building_images", building_dir)
-            images = [f for f in os.listdir(building_path) if f.endswith('.png')]
-            total_images += len(images)
+        with os.scandir("building_images") as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    building_dirs.append(entry.name)
+                    with os.scandir(entry.path) as images:
+                        total_images += sum(1 for image in images if image.name.endswith('.png'))
         
         print(f"عدد المباني المعالجة: {len(building_dirs)}")
         print(f"إجمالي الصور المستخرجة: {total_images}")
@@ -37,29 +64,23 @@ def check_progress():
     
     # Check building data
     if os.path.exists("building_data"):
-        building_files = os.listdir("building_data")
         print(f"\nملفات البيانات:")
-        for file in building_files:
-            file_path = os.path.join("building_data", file)
-            if os.path.isfile(file_path):
-                size = os.path.getsize(file_path)
-                print(f"  {file}: {size} bytes")
+        with os.scandir("building_data") as entries:
+            for entry in entries:
+                if entry.is_file():
+                    print(f"  {entry.name}: {entry.stat().st_size} bytes")
     
     # Check AI suggestions
     if os.path.exists("ai_suggestions"):
-        suggestion_files = os.listdir("ai_suggestions")
         print(f"\nملفات الاقتراحات:")
-        for file in suggestion_files:
-            file_path = os.path.join("ai_suggestions", file)
-            if os.path.isfile(file_path):
-                size = os.path.getsize(file_path)
-                print(f"  {file}: {size} bytes")
+        with os.scandir("ai_suggestions") as entries:
+            for entry in entries:
+                if entry.is_file():
+                    print(f"  {entry.name}: {entry.stat().st_size} bytes")
     
     # Check if process is still running
-    import subprocess
     try:
-        result = subprocess.run(['pgrep', '-f', 'building_analyzer'], capture_output=True, text=True)
-        if result.returncode == 0:
+        if is_process_running("building_analyzer"):
             print(f"\n✅ عملية التحليل لا تزال تعمل...")
         else:
             print(f"\n✅ عملية التحليل اكتملت!")
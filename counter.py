@@ -1,13 +1,34 @@
+import mmap
 import tiktoken
 import PyPDF2
 
+try:
+    import pypdfium2 as pdfium  # optional, faster text extraction than PyPDF2
+except ImportError:
+    pdfium = None
+
 
 def load_file(path): 
     """
     extract each word in the file pdf and return and calc the tokens numbers
+    uses pypdfium2 when it is installed (pdfium extra) and falls back to PyPDF2
     """
-    with open(path, 'rb') as f:
-        reader = PyPDF2.PdfReader(f)
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            parts = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                # pdfium ends lines with \r\n, PyPDF2 with \n
+                parts.append(textpage.get_text_range().replace("\r\n", "\n"))
+                textpage.close()
+                page.close()
+            return "".join(parts)
+        finally:
+            pdf.close()
+    
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        reader = PyPDF2.PdfReader(mm)
         return "".join(page.extract_text() or "" for page in reader.pages)
 
 
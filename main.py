@@ -1,21 +1,28 @@
 # main imports
 import os
-import json
+import argparse
+import asyncio
 import csv
-import uuid
+from secrets import token_hex
 import random
 import re
+import hashlib
+import mmap
+import time
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-import PyPDF2
 from google import genai
+from google.genai import types
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field
+from pydantic import Field, create_model
 from PIL import Image
 import io
-import fitz  # PyMuPDF for image extraction
+import fitz  # PyMuPDF for text and image extraction
+import orjson
 
 load_dotenv()
 
@@ -23,60 +30,107 @@ load_dotenv()
 os.makedirs("extracted_images", exist_ok=True)
 os.makedirs("output", exist_ok=True)
 
+# Maximum number of Gemini requests in flight at the same time
+MAX_CONCURRENT_REQUESTS = 4
+
+# Context caching needs an explicit model version
+GEMINI_MODEL = 'gemini-2.0-flash-001'
+GEMINI_CACHE_TTL_SECONDS = 3600
+GEMINI_CACHE_TTL = f"{GEMINI_CACHE_TTL_SECONDS}s"
+
+# A context cache is replaced this long before it expires, so requests in flight never use an expired cache
+GEMINI_CACHE_REFRESH_MARGIN_SECONDS = 300
+
+# Created on first use by _get_client and shared by every request in this process
+_GEMINI_CLIENT = None
+
+# Gemini context cache lookups keyed by language and schema, with their creation time
+# (the lookups resolve to None if caching failed)
+_schema_cache: Dict[str, Tuple[float, "asyncio.Future[Optional[str]]"]] = {}
+
+# Names of the context caches created in this process, deleted by delete_instruction_caches
+_created_caches: List[str] = []
+
+_ARABIC_PATTERN = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]')
+
+# Only this much document text is sent to the model
+MAX_TEXT_CHARS = 5000
+
+# Number of leading characters checked when detecting the language
+LANGUAGE_SAMPLE_CHARS = 2000
+
+# Size of the blocks read when hashing a PDF
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+# Columns added to every result next to the extracted fields
+METADATA_FIELDS = ("pdf_filename", "detected_language", "image_count", "image_paths",
+                   "processing_timestamp", "document_size_mb")
+
 def detect_language(text: str) -> str:
     """
-    Detect if text contains Arabic characters
+    Detect if the beginning of the text contains Arabic characters
     """
-    arabic_pattern = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]')
-    if arabic_pattern.search(text):
+    if _ARABIC_PATTERN.search(text, 0, LANGUAGE_SAMPLE_CHARS):
         return "arabic"
     return "english"
 
-def extract_images_from_pdf(pdf_path: str, output_dir: str) -> List[str]:
+def _write_image(image: Tuple[str, bytes]) -> bool:
     """
-    Extract images from PDF and save them to output directory
-    Returns list of saved image paths
+    Write one extracted image to disk, returns False if the write failed
     """
-    image_paths = []
+    image_path, image_bytes = image
     try:
-        doc = fitz.open(pdf_path)
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            image_list = page.get_images()
-            
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                
-                # Generate random ID for image
-                image_id = str(uuid.uuid4())[:8]
-                image_filename = f"{Path(pdf_path).stem}_page_{page_num + 1}_img_{img_index + 1}_{image_id}.png"
-                image_path = os.path.join(output_dir, image_filename)
-                
-                # Save image
-                with open(image_path, "wb") as image_file:
-                    image_file.write(image_bytes)
-                
-                image_paths.append(image_path)
-        
-        doc.close()
-    except Exception as e:
-        print(f"Error extracting images from {pdf_path}: {e}")
-    
-    return image_paths
+        Path(image_path).write_bytes(image_bytes)
+        return True
+    except OSError as e:
+        print(f"Error saving image {image_path}: {e}")
+        return False
 
-def load_file(path: str) -> str:
+def extract_pdf(pdf_path: str, output_dir: str, max_chars: int = MAX_TEXT_CHARS) -> Tuple[str, List[str], bool]:
     """
-    Loading the file for operation
+    Extract text and images from PDF in a single pass over its pages
+    Text extraction stops once max_chars characters are collected
+    Images are saved to output directory
+    Returns (text, list of saved image paths, whether the whole document was read)
     """
+    text_parts = []
+    text_length = 0
+    images = []
+    extracted = False
     try:
-        with open(path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            return "".join(page.extract_text() or "" for page in reader.pages)
+        # Map the file instead of reading it through stdio buffers, MuPDF seeks around it freely
+        with open(pdf_path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            doc = fitz.open(stream=view, filetype="pdf")
+            for page_num, page in enumerate(doc):
+                if text_length < max_chars:
+                    page_text = page.get_text("text")
+                    text_parts.append(page_text)
+                    text_length += len(page_text)
+                
+                for img_index, img in enumerate(page.get_images()):
+                    xref = img[0]
+                    base_image = doc.extract_image(xref)
+                    image_bytes = base_image["image"]
+                    
+                    # Generate random ID for image
+                    image_id = token_hex(4)
+                    image_filename = f"{Path(pdf_path).stem}_page_{page_num + 1}_img_{img_index + 1}_{image_id}.png"
+                    image_path = os.path.join(output_dir, image_filename)
+                    
+                    images.append((image_path, image_bytes))
+            
+            doc.close()
+        extracted = True
     except Exception as e:
-        print(f"Error reading PDF {path}: {e}")
-        return ""
+        print(f"Error reading PDF {pdf_path}: {e}")
+    
+    # Save the images extracted so far concurrently, the GIL is released during the file writes
+    # Only paths of images that were actually written are returned
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        written = list(executor.map(_write_image, images))
+    image_paths = [image_path for (image_path, _), ok in zip(images, written) if ok]
+    
+    return "\n".join(text_parts)[:max_chars], image_paths, extracted
 
 def generate_random_csv_structure(language: str = "english") -> Dict[str, str]:
     """
@@ -135,59 +189,131 @@ def generate_random_csv_structure(language: str = "english") -> Dict[str, str]:
     
     return dict(selected_fields)
 
-def analyze_pdf_with_ai(pdf_text: str, pdf_path: str, client: genai.Client, language: str = "english") -> Dict[str, Any]:
+def _get_client() -> genai.Client:
     """
-    Analyze PDF content using AI and return structured data
+    Return the shared Gemini client, creating it on first use
+    """
+    global _GEMINI_CLIENT
+    if _GEMINI_CLIENT is None:
+        _GEMINI_CLIENT = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+    return _GEMINI_CLIENT
+
+async def _create_instructions_cache(client: genai.Client, instructions: str) -> Optional[str]:
+    """
+    Create a Gemini context cache holding the instructions and return its name
+    Returns None when the cache cannot be created (e.g. instructions below the minimum cache size)
+    """
+    try:
+        cache = await client.aio.caches.create(
+            model=GEMINI_MODEL,
+            config=types.CreateCachedContentConfig(
+                system_instruction=instructions,
+                ttl=GEMINI_CACHE_TTL
+            )
+        )
+        _created_caches.append(cache.name)
+        return cache.name
+    except Exception as e:
+        print(f"Context cache not available, sending full prompt: {e}")
+        return None
+
+async def delete_instruction_caches(client: genai.Client):
+    """
+    Delete the Gemini context caches created in this process instead of leaving them until they expire
+    """
+    _schema_cache.clear()
+    while _created_caches:
+        cache_name = _created_caches.pop()
+        try:
+            await client.aio.caches.delete(name=cache_name)
+        except Exception as e:
+            print(f"Could not delete context cache {cache_name}: {e}")
+
+async def get_cached_instructions(client: genai.Client, language: str, csv_structure: Dict[str, str],
+                                  instructions: str) -> Optional[str]:
+    """
+    Return the name of a Gemini context cache holding the instructions for this schema
+    Concurrent requests for the same schema share a single cache creation
+    The cache is recreated when it gets close to its TTL, since long batches outlive it
+    """
+    key = hashlib.sha256(repr((language, tuple(sorted(csv_structure.items())))).encode("utf-8")).hexdigest()
+    now = time.monotonic()
+    if key not in _schema_cache or now - _schema_cache[key][0] > GEMINI_CACHE_TTL_SECONDS - GEMINI_CACHE_REFRESH_MARGIN_SECONDS:
+        _schema_cache[key] = (now, asyncio.ensure_future(_create_instructions_cache(client, instructions)))
+    return await _schema_cache[key][1]
+
+def is_numeric_field(field_name: str) -> bool:
+    """
+    Check from its name whether a field holds a number (date fields are always text)
+    """
+    if "date" in field_name.lower() or "تاريخ" in field_name:
+        return False
+    return any(word in field_name.lower() for word in ["revenue", "income", "assets", "count", "score", "size", "إيرادات", "دخل", "أصول", "عدد", "درجة", "حجم"])
+
+@lru_cache(maxsize=None)
+def build_schema_model(language: str, fields: Tuple[Tuple[str, str], ...]) -> Tuple[type, str]:
+    """
+    Create a Pydantic model for the given (field name, description) pairs
+    Returns (model, schema JSON), built once per structure
     """
-    # Generate random structure for this document
-    csv_structure = generate_random_csv_structure(language)
-    
-    # Create a dynamic Pydantic model based on the structure
     field_definitions = {}
-    for field_name, description in csv_structure.items():
-        if "date" in field_name.lower() or "تاريخ" in field_name:
-            field_definitions[field_name] = (Optional[str], Field(None, description=description))
-        elif any(word in field_name.lower() for word in ["revenue", "income", "assets", "count", "score", "size", "إيرادات", "دخل", "أصول", "عدد", "درجة", "حجم"]):
+    for field_name, description in fields:
+        if is_numeric_field(field_name):
             field_definitions[field_name] = (Optional[float], Field(None, description=description))
         else:
             field_definitions[field_name] = (Optional[str], Field(None, description=description))
     
     # Create dynamic model
-    DynamicModel = type('DynamicModel', (BaseModel,), field_definitions)
+    DynamicModel = create_model('DynamicModel', **field_definitions)
     
     # Create schema definition
-    schema_definition = json.dumps(DynamicModel.model_json_schema(), indent=2, ensure_ascii=False)
+    schema_definition = orjson.dumps(DynamicModel.model_json_schema(), option=orjson.OPT_INDENT_2).decode()
     
-    # Create language-specific prompt
-    if language == "arabic":
-        prompt = f"""حلل المستند التالي واستخرج المعلومات وفقاً لهذا المخطط:
-
-محتوى المستند:
-{pdf_text[:5000]}...  # مختصر للحد من الرموز
+    return DynamicModel, schema_definition
 
-استخرج وقم ببناء البيانات وفقاً لهذا المخطط:
+async def analyze_pdf_with_ai(pdf_text: str, pdf_path: str, client: genai.Client, language: str = "english",
+                              csv_structure: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Analyze PDF content using AI and return structured data
+    Uses a random structure for this document unless csv_structure is given
+    """
+    if csv_structure is None:
+        csv_structure = generate_random_csv_structure(language)
+    
+    DynamicModel, schema_definition = build_schema_model(language, tuple(csv_structure.items()))
+    
+    # Create language-specific instructions; only the document content changes between calls
+    if language == "arabic":
+        instructions = f"""حلل المستند واستخرج المعلومات وفقاً لهذا المخطط:
 {schema_definition}
 
 أرجع فقط بيانات JSON المطابقة للمخطط تماماً."""
+        document = f"""محتوى المستند:
+{pdf_text[:MAX_TEXT_CHARS]}...  # مختصر للحد من الرموز"""
     else:
-        prompt = f"""Analyze the following document and extract information according to this schema:
-
-Document content:
-{pdf_text[:5000]}...  # Truncated for token limits
-
-Extract and structure the data according to this schema:
+        instructions = f"""Analyze the document and extract information according to this schema:
 {schema_definition}
 
 Return only the JSON data matching the schema exactly."""
+        document = f"""Document content:
+{pdf_text[:MAX_TEXT_CHARS]}...  # Truncated for token limits"""
+
+    config = {
+        'response_mime_type': 'application/json',
+        'response_schema': DynamicModel
+    }
+    cache_name = await get_cached_instructions(client, language, csv_structure, instructions)
+    if cache_name:
+        config['cached_content'] = cache_name
+        contents = document
+    else:
+        contents = f"{instructions}\n\n{document}"
 
     try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt,
-            config={
-                'response_mime_type': 'application/json',
-                'response_schema': DynamicModel
-            }
+        response = await client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=config
         )
         
         # Parse response
@@ -199,167 +325,313 @@ Return only the JSON data matching the schema exactly."""
         # Return empty dict with structure
         return {field: None for field in csv_structure.keys()}
 
-def convert_to_binary_data(data: Dict[str, Any]) -> Dict[str, int]:
+def number_to_binary(value: Optional[float]) -> int:
     """
-    Convert data to binary format (0/1) for categorical fields
+    Convert a numeric field value to binary format, 1 if > 0 and 0 otherwise (including None)
     """
-    binary_data = {}
-    
-    for key, value in data.items():
-        if isinstance(value, (int, float)) and value is not None:
-            # For numeric values, use 1 if > 0, 0 otherwise
-            binary_data[key] = 1 if value > 0 else 0
-        elif isinstance(value, str) and value:
-            # For string values, use 1 if not empty, 0 otherwise
-            binary_data[key] = 1 if value.strip() else 0
-        else:
-            # For None or empty values, use 0
-            binary_data[key] = 0
-    
-    return binary_data
+    return 1 if value is not None and value > 0 else 0
 
-def process_pdfs_in_directory(directory: str = ".") -> List[Dict[str, Any]]:
+def text_to_binary(value: Optional[str]) -> int:
     """
-    Process all PDF files in directory and return structured data
+    Convert a text field value to binary format, 1 if not empty and 0 otherwise (including None)
     """
-    pdf_files = [f for f in os.listdir(directory) if f.lower().endswith('.pdf')]
-    results = []
-    
-    # Initialize Gemini client
-    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+    return 1 if value is not None and value.strip() else 0
+
+def _extract_one_pdf(pdf_path: str) -> Tuple[str, List[str], str, bool]:
+    """
+    Extract text and images from a single PDF and detect its language
+    Runs in a worker process, since PyMuPDF holds the GIL while parsing
+    Returns (text, list of saved image paths, language, whether extraction succeeded)
+    """
+    pdf_text, image_paths, extracted = extract_pdf(pdf_path, "extracted_images")
+    return pdf_text, image_paths, detect_language(pdf_text), extracted
+
+def file_digest(path: str) -> Optional[str]:
+    """
+    Return the SHA-256 hex digest of a file's content, or None if it cannot be read
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(DIGEST_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    except OSError as e:
+        print(f"Error reading PDF {path}: {e}")
+        return None
+    return digest.hexdigest()
+
+def load_cached_structures(cache_dir: str) -> Optional[Dict[str, Dict[str, str]]]:
+    """
+    Load the CSV structures the cached results were extracted with
+    Returns None if no structures have been saved yet
+    """
+    try:
+        with open(os.path.join(cache_dir, "structures.json"), 'rb') as f:
+            csv_structures = orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
     
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(directory, pdf_file)
-        print(f"Processing: {pdf_file}")
-        
-        # Extract images
-        image_paths = extract_images_from_pdf(pdf_path, "extracted_images")
-        print(f"  Extracted {len(image_paths)} images")
-        
-        # Extract text
-        pdf_text = load_file(pdf_path)
-        
-        # Detect language
-        language = detect_language(pdf_text)
-        print(f"  Detected language: {language}")
-        
-        # Analyze with AI
-        analysis_result = analyze_pdf_with_ai(pdf_text, pdf_path, client, language)
-        
-        # Add metadata
-        analysis_result.update({
-            "pdf_filename": pdf_file,
-            "detected_language": language,
-            "image_count": len(image_paths),
-            "image_paths": ";".join(image_paths),
-            "processing_timestamp": datetime.now().isoformat(),
-            "document_size_mb": round(os.path.getsize(pdf_path) / (1024 * 1024), 2)
-        })
-        
-        results.append(analysis_result)
-        print(f"  Completed analysis of {pdf_file}")
+    if set(csv_structures) != {"arabic", "english"}:
+        return None
+    return csv_structures
+
+def save_cached_structures(cache_dir: str, csv_structures: Dict[str, Dict[str, str]]):
+    """
+    Save the CSV structures of this batch next to its cached results
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, "structures.json"), 'wb') as f:
+        f.write(orjson.dumps(csv_structures))
+
+def load_cached_analysis(cache_dir: str, digest: str, csv_structures: Dict[str, Dict[str, str]]) -> Optional[Dict[str, Any]]:
+    """
+    Load a previous result for the file with this digest
+    Returns None if there is none or it lacks fields of this batch's structure
+    """
+    try:
+        with open(os.path.join(cache_dir, f"{digest}.json"), 'rb') as f:
+            result = orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
     
-    return results
+    structure = csv_structures.get(result.get("detected_language"), {})
+    if not structure or not set(structure) <= result.keys():
+        return None
+    return result
+
+def save_cached_analysis(cache_dir: str, digest: str, result: Dict[str, Any]):
+    """
+    Save a result under the digest of its file
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, f"{digest}.json"), 'wb') as f:
+        f.write(orjson.dumps(result))
 
-def save_to_csv_files(results: List[Dict[str, Any]]):
+async def _analyze_one_pdf(pdf_path: str, pdf_size: int, digest: Optional[str], client: genai.Client,
+                           executor: ProcessPoolExecutor, semaphore: asyncio.Semaphore,
+                           csv_structures: Dict[str, Dict[str, str]], cache_dir: Optional[str]) -> Dict[str, Any]:
     """
-    Save results to three different CSV files: Arabic, English, and Binary
+    Extract and analyze a single PDF file of pdf_size bytes and return its structured data
+    Results are loaded from and saved to cache_dir unless it is None
     """
-    if not results:
-        print("No results to save")
-        return
+    pdf_file = os.path.basename(pdf_path)
+    print(f"Processing: {pdf_file}")
     
-    # Separate results by language
-    arabic_results = []
-    english_results = []
+    if cache_dir:
+        cached_result = load_cached_analysis(cache_dir, digest, csv_structures)
+        if cached_result is not None:
+            print(f"  {pdf_file}: Loaded cached analysis")
+            return cached_result
     
-    for result in results:
-        if result.get("detected_language") == "arabic":
-            arabic_results.append(result)
-        else:
-            english_results.append(result)
+    # Extract text and images and detect language in a worker process
+    loop = asyncio.get_running_loop()
+    pdf_text, image_paths, language, extracted = await loop.run_in_executor(executor, _extract_one_pdf, pdf_path)
+    print(f"  {pdf_file}: Extracted {len(image_paths)} images")
+    print(f"  {pdf_file}: Detected language: {language}")
+    
+    # Analyze with AI, limiting how many requests are in flight at once
+    async with semaphore:
+        analysis_result = await analyze_pdf_with_ai(pdf_text, pdf_path, client, language, csv_structures[language])
+    
+    # A failed analysis comes back with every field empty; neither it nor an analysis of a
+    # partly read document is cached, so the next run tries again
+    analyzed = extracted and any(value is not None for value in analysis_result.values())
     
-    # Save Arabic CSV
-    if arabic_results:
-        save_language_csv(arabic_results, "output/arabic_data.csv", "arabic")
+    # Add metadata
+    analysis_result.update({
+        "pdf_filename": pdf_file,
+        "detected_language": language,
+        "image_count": len(image_paths),
+        "image_paths": ";".join(image_paths),
+        "processing_timestamp": datetime.now().isoformat(),
+        "document_size_mb": round(pdf_size / (1024 * 1024), 2)
+    })
     
-    # Save English CSV
-    if english_results:
-        save_language_csv(english_results, "output/english_data.csv", "english")
+    if cache_dir and analyzed:
+        save_cached_analysis(cache_dir, digest, analysis_result)
     
-    # Save Binary CSV (combine all results)
-    save_binary_csv(results, "output/binary_data.csv")
+    print(f"  Completed analysis of {pdf_file}")
+    return analysis_result
 
-def save_language_csv(results: List[Dict[str, Any]], output_file: str, language: str):
+async def _process_one_pdf(pdf_path: str, analysis: "asyncio.Future[Dict[str, Any]]") -> Optional[Dict[str, Any]]:
     """
-    Save results to language-specific CSV file
+    Wait for the analysis of a single PDF file and return its structured data
+    The analysis may be shared with byte-identical files, so the result is copied
+    Returns None if processing failed, so the other files still finish
+    """
+    try:
+        analysis_result = dict(await analysis)
+    except Exception as e:
+        print(f"Error processing {pdf_path}: {e}")
+        return None
+    analysis_result["pdf_filename"] = os.path.basename(pdf_path)
+    return analysis_result
+
+class CsvWriterGroup:
+    """
+    Write results to the Arabic, English and Binary CSV files one at a time
+    Columns come from the batch structures, files are opened on their first row
     """
-    if not results:
-        return
     
-    # Get all unique field names
-    all_fields = set()
-    for result in results:
-        all_fields.update(result.keys())
+    def __init__(self, csv_structures: Dict[str, Dict[str, str]], output_dir: str = "output"):
+        self.field_names = {
+            language: sorted(set(structure) | set(METADATA_FIELDS))
+            for language, structure in csv_structures.items()
+        }
+        self.binary_field_names = sorted(set().union(*self.field_names.values()))
+        # Field types are fixed by the schema, so each column's converter is picked once
+        self.binary_converters = [
+            (field, number_to_binary if is_numeric_field(field) else text_to_binary)
+            for field in self.binary_field_names
+        ]
+        self.output_files = {language: os.path.join(output_dir, f"{language}_data.csv") for language in csv_structures}
+        self.binary_file = os.path.join(output_dir, "binary_data.csv")
+        self.counts = {language: 0 for language in csv_structures}
+        self.sample: Optional[Dict[str, Any]] = None
+        self._handles = {}
+        self._writers = {}
+        self._binary_handle = None
+        self._binary_writer = None
     
-    # Sort fields for consistent ordering
-    field_names = sorted(list(all_fields))
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
     
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=field_names)
-        writer.writeheader()
+    def write(self, result: Dict[str, Any]):
+        language = "arabic" if result.get("detected_language") == "arabic" else "english"
+        
+        if language not in self._writers:
+            self._handles[language] = open(self.output_files[language], 'w', newline='', encoding='utf-8')
+            self._writers[language] = csv.DictWriter(self._handles[language], fieldnames=self.field_names[language],
+                                                     extrasaction='ignore')
+            self._writers[language].writeheader()
+        self._writers[language].writerow(result)
         
-        for result in results:
-            # Ensure all fields are present
-            row = {field: result.get(field, "") for field in field_names}
-            writer.writerow(row)
+        if self._binary_writer is None:
+            self._binary_handle = open(self.binary_file, 'w', newline='', encoding='utf-8')
+            self._binary_writer = csv.writer(self._binary_handle)
+            self._binary_writer.writerow(self.binary_field_names)
+        # Missing fields become 0
+        self._binary_writer.writerow([convert(result.get(field)) for field, convert in self.binary_converters])
+        
+        if self.sample is None:
+            self.sample = result
+        self.counts[language] += 1
+    
+    def close(self):
+        for language, handle in self._handles.items():
+            handle.close()
+            print(f"{language.capitalize()} data saved to {self.output_files[language]}")
+        self._handles = {}
+        self._writers = {}
+        if self._binary_handle is not None:
+            self._binary_handle.close()
+            print(f"Binary data saved to {self.binary_file}")
+            self._binary_handle = None
+            self._binary_writer = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+async def _process_pdfs(pdf_files: List[Tuple[str, int]], csv_structures: Dict[str, Dict[str, str]],
+                        writers: CsvWriterGroup, cache_dir: Optional[str]):
+    """
+    Extract PDFs in worker processes and send all Gemini requests concurrently
+    Each result is written as soon as its PDF is done instead of being kept in memory
+    """
+    client = _get_client()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    analyses = {}
     
-    print(f"{language.capitalize()} data saved to {output_file}")
+    # Hash every file before extraction starts, so the pool still receives the largest files first
+    # Hashing is mostly I/O and releases the GIL, so it runs on the default thread pool
+    loop = asyncio.get_running_loop()
+    digests = await asyncio.gather(*(loop.run_in_executor(None, file_digest, pdf_path) for pdf_path, _ in pdf_files))
+    
+    try:
+        with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 8)) as executor:
+            # Analyses are started in scan order, and byte-identical files share one of them
+            # A file that could not be hashed gets its own, without the result cache
+            tasks = []
+            for (pdf_path, pdf_size), digest in zip(pdf_files, digests):
+                if digest is not None and digest in analyses:
+                    print(f"Same content as an earlier file, reusing its analysis: {os.path.basename(pdf_path)}")
+                    analysis = analyses[digest]
+                else:
+                    analysis = asyncio.ensure_future(_analyze_one_pdf(
+                        pdf_path, pdf_size, digest, client, executor, semaphore, csv_structures,
+                        cache_dir if digest is not None else None
+                    ))
+                    if digest is not None:
+                        analyses[digest] = analysis
+                tasks.append(asyncio.ensure_future(_process_one_pdf(pdf_path, analysis)))
+            
+            # Duplicates already hold their shared analysis, and finished tasks are not referenced
+            # anywhere else, so each result is freed once it is written
+            analyses.clear()
+            completed = asyncio.as_completed(tasks)
+            del tasks
+            for task in completed:
+                analysis_result = await task
+                if analysis_result is not None:
+                    writers.write(analysis_result)
+    finally:
+        # The batch's context caches are billed while they exist
+        await delete_instruction_caches(client)
 
-def save_binary_csv(results: List[Dict[str, Any]], output_file: str):
+def process_pdfs_in_directory(directory: str = ".", output_dir: str = "output", use_cache: bool = True) -> CsvWriterGroup:
     """
-    Save results to binary CSV file (0/1 values)
+    Process all PDF files in directory and write the structured data to CSV files
+    PDFs are extracted in parallel worker processes while their Gemini requests run concurrently
+    With use_cache, results are kept in output_dir/_analysis_cache by file content and reused,
+    and so are the CSV structures they were extracted with
+    Returns the closed writer group with per-language counts and a sample result
     """
-    if not results:
-        return
+    # Sizes are read once while scanning and passed along, instead of stat-ing each file again later
+    with os.scandir(directory) as entries:
+        pdf_files = [
+            (entry.path, entry.stat().st_size) for entry in entries
+            if entry.is_file() and entry.name.lower().endswith('.pdf')
+        ]
     
-    # Get all unique field names
-    all_fields = set()
-    for result in results:
-        all_fields.update(result.keys())
+    # Start the largest files first so a big PDF is not left running alone at the end
+    pdf_files.sort(key=lambda pdf_file: pdf_file[1], reverse=True)
     
-    # Sort fields for consistent ordering
-    field_names = sorted(list(all_fields))
+    cache_dir = os.path.join(output_dir, "_analysis_cache") if use_cache else None
     
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=field_names)
-        writer.writeheader()
-        
-        for result in results:
-            # Convert to binary format
-            binary_row = convert_to_binary_data(result)
-            # Ensure all fields are present
-            row = {field: binary_row.get(field, 0) for field in field_names}
-            writer.writerow(row)
+    # Use one random structure per language for the whole batch
+    # With the cache on, the saved structures are kept so earlier results stay reusable
+    csv_structures = load_cached_structures(cache_dir) if cache_dir else None
+    if csv_structures is None:
+        csv_structures = {language: generate_random_csv_structure(language) for language in ("arabic", "english")}
+        if cache_dir:
+            save_cached_structures(cache_dir, csv_structures)
     
-    print(f"Binary data saved to {output_file}")
+    with CsvWriterGroup(csv_structures, output_dir) as writers:
+        asyncio.run(_process_pdfs(pdf_files, csv_structures, writers, cache_dir))
+    
+    return writers
 
 def main():
     """
     Main function to process PDFs and generate output
     """
+    parser = argparse.ArgumentParser(description="Extract structured data from the PDFs in the current directory")
+    parser.add_argument("--no-cache", action="store_true", help="analyze every PDF again instead of reusing cached results")
+    args = parser.parse_args()
+    
     print("Starting PDF processing...")
     
-    # Process all PDFs in current directory
-    results = process_pdfs_in_directory()
+    # Process all PDFs in current directory, saving to multiple CSV files as they complete
+    writers = process_pdfs_in_directory(use_cache=not args.no_cache)
     
-    if results:
-        # Save to multiple CSV files
-        save_to_csv_files(results)
-        
+    if writers.count:
         # Print summary
         print(f"\nProcessing complete!")
-        print(f"Processed {len(results)} PDF files")
+        print(f"Processed {writers.count} PDF files")
         print(f"Extracted images saved to: extracted_images/")
         print(f"CSV files saved to: output/")
         print(f"  - arabic_data.csv (Arabic documents)")
@@ -367,17 +639,14 @@ def main():
         print(f"  - binary_data.csv (Binary format 0/1)")
         
         # Show language distribution
-        arabic_count = sum(1 for r in results if r.get("detected_language") == "arabic")
-        english_count = len(results) - arabic_count
         print(f"\nLanguage distribution:")
-        print(f"  Arabic documents: {arabic_count}")
-        print(f"  English documents: {english_count}")
+        print(f"  Arabic documents: {writers.counts['arabic']}")
+        print(f"  English documents: {writers.counts['english']}")
         
         # Show sample of results
-        if results:
-            print(f"\nSample data from first document:")
-            for key, value in list(results[0].items())[:5]:
-                print(f"  {key}: {value}")
+        print(f"\nSample data from first document:")
+        for key, value in list(writers.sample.items())[:5]:
+            print(f"  {key}: {value}")
     else:
         print("No PDF files found to process")
 
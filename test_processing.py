@@ -95,14 +95,13 @@ def main():
     
     # Import and run the main processing
     try:
-        from main import process_pdfs_in_directory, save_to_csv_files
+        from main import process_pdfs_in_directory
         
         print("\nStarting processing...")
-        results = process_pdfs_in_directory(".")
+        writers = process_pdfs_in_directory(".")
         
-        if results:
-            save_to_csv_files(results)
-            print(f"\nSuccessfully processed {len(results)} documents!")
+        if writers.count:
+            print(f"\nSuccessfully processed {writers.count} documents!")
             
             # Show directory structure
             print("\nGenerated files:")
@@ -129,11 +128,9 @@ def main():
                     print(csv_file)
             
             # Show language distribution
-            arabic_count = sum(1 for r in results if r.get("detected_language") == "arabic")
-            english_count = len(results) - arabic_count
             print(f"\nLanguage distribution:")
-            print(f"  Arabic documents: {arabic_count}")
-            print(f"  English documents: {english_count}")
+            print(f"  Arabic documents: {writers.counts['arabic']}")
+            print(f"  English documents: {writers.counts['english']}")
                 
         else:
             print("No results generated")